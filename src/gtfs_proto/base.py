@@ -1,4 +1,5 @@
 from . import gtfs_pb2 as gtfs
+from collections.abc import Iterable
 from functools import cached_property
 
 
@@ -31,6 +32,22 @@ class StringCache:
             self.index[s] = len(self.strings) - 1
             return len(self.strings) - 1
 
+    def add_many(self, strings: Iterable[str | None]) -> list[int]:
+        """Adds strings in order, returning the same indices as add() would."""
+        index = self.index
+        table = self.strings
+        result: list[int] = []
+        for s in strings:
+            if not s:
+                result.append(0)
+                continue
+            i = index.get(s)
+            if not i:
+                i = index[s] = len(table)
+                table.append(s)
+            result.append(i)
+        return result
+
     def search(self, s: str) -> int | None:
         """Looks for a string case-insensitive."""
         i = self.index.get(s)
@@ -42,6 +59,19 @@ class StringCache:
                 return j
         return None
 
+    def search_many(self, strings: list[str]) -> list[int | None]:
+        """Looks for multiple strings case-insensitive, scanning the table just once."""
+        result = [self.index.get(s) for s in strings]
+        if all(result):
+            return result
+        missing = {s.lower() for s, i in zip(strings, result) if not i}
+        found: dict[str, int] = {}
+        for j, v in enumerate(self.strings):
+            lv = v.lower()
+            if lv in missing and lv not in found:
+                found[lv] = j
+        return [i or found.get(s.lower()) for s, i in zip(strings, result)]
+
     def store(self) -> bytes:
         return gtfs.StringTable(strings=self.strings).SerializeToString()
 
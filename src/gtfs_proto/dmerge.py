@@ -1,11 +1,18 @@
 import argparse
 import sys
+from collections.abc import Iterable
+from operator import attrgetter
 from . import (
     gtfs, GtfsDelta, FareLinks, StringCache,
     parse_calendar, build_calendar, int_to_date,
 )
 
 
+# Builds the tuple of fields identifying a transfer in C.
+_transfer_key = attrgetter(
+    'from_stop', 'to_stop', 'from_route', 'to_route', 'from_trip', 'to_trip')
+
+
 class DeltaMerger:
     def __init__(self, d_strings: StringCache, new_strings: StringCache):
         self.strings = d_strings
@@ -16,10 +23,14 @@ class DeltaMerger:
             return self.strings.add(self.s_new[sid])
         return 0
 
+    def add_strings(self, sids: Iterable[int]) -> list[int]:
+        s_new = self.s_new
+        return self.strings.add_many(s_new[sid] for sid in sids)
+
     def agencies(self, a1: list[gtfs.Agency], a2: list[gtfs.Agency]) -> list[gtfs.Agency]:
         ad1 = {a.agency_id: a for a in a1}
         for a in a2:
-            if a == gtfs.Agency(a.agency_id):
+            if a == gtfs.Agency(agency_id=a.agency_id):
                 ad1[a.agency_id] = a
             elif a.agency_id not in ad1:
                 # Add an agency and its strings.
@@ -27,25 +38,43 @@ class DeltaMerger:
                 ad1[a.agency_id] = a
             else:
                 # Merge two changes.
-                first = ad1[a.agency_id]
-                ad1[a.agency_id] = gtfs.Agency(
-                    agency_id=a.agency_id,
-                    name=a.name or first.name,
-                    url=a.url or first.url,
-                    timezone=self.add_string(a.timezone) or first.timezone,
-                    lang=a.lang or first.lang,
-                    phone=a.phone or first.phone,
-                    fare_url=a.fare_url or first.fare_url,
-                    email=a.email or first.email,
-                )
+                # MergeFrom only overwrites fields set in the new agency.
+                a.timezone = self.add_string(a.timezone)
+                ad1[a.agency_id].MergeFrom(a)
         return list(ad1.values())
 
     def calendar(self, c1: gtfs.Calendar, c2: gtfs.Calendar) -> gtfs.Calendar:
+        if c1.base_date == c2.base_date:
+            return self.calendar_same_base(c1, c2)
         cd1 = {c.service_id: c for c in parse_calendar(c1)}
         for c in parse_calendar(c2):
             cd1[c.service_id] = c
         return build_calendar(list(cd1.values()), int_to_date(c2.base_date))
 
+    def calendar_same_base(self, c1: gtfs.Calendar, c2: gtfs.Calendar) -> gtfs.Calendar:
+        """Merges services without decoding dates, producing what build_calendar() would."""
+        services = {s.service_id: (s, c1) for s in c1.services}
+        for s in c2.services:
+            services[s.service_id] = (s, c2)
+
+        dates: dict[tuple[int, ...], int] = {(): 0}
+
+        def date_index(c: gtfs.Calendar, i: int) -> int:
+            return dates.setdefault(tuple(c.dates[i].dates), len(dates))
+
+        result = gtfs.Calendar(base_date=c2.base_date)
+        for s, c in services.values():
+            result.services.append(gtfs.CalendarService(
+                service_id=s.service_id,
+                start_date=s.start_date,
+                end_date=s.end_date,
+                weekdays=s.weekdays,
+                added_days=date_index(c, s.added_days),
+                removed_days=date_index(c, s.removed_days),
+            ))
+        result.dates.extend(gtfs.CalendarDates(dates=d) for d in dates)
+        return result
+
     def shapes(self, s1: list[gtfs.Shape], s2: list[gtfs.Shape]) -> list[gtfs.Shape]:
         sd1 = {s.shape_id: s for s in s1}
         for s in s2:
@@ -55,60 +84,62 @@ class DeltaMerger:
     def stops(self, s1: list[gtfs.Stop], s2: list[gtfs.Stop]) -> list[gtfs.Stop]:
         sd1 = {s.stop_id: s for s in s1}
         for s in s2:
+            if s.delete:
+                # Deleted stops carry no strings.
+                sd1[s.stop_id] = s
+                continue
             s.name = self.add_string(s.name)
-            if s.delete or s.stop_id not in sd1:
+            if s.stop_id not in sd1:
                 sd1[s.stop_id] = s
             else:
                 first = sd1[s.stop_id]
-                sd1[s.stop_id] = gtfs.Stop(
-                    stop_id=s.stop_id,
-                    code=first.code or s.code,
-                    name=s.name or first.name,
-                    desc=s.desc or first.desc,
-                    lat=s.lat or first.lat,
-                    lon=s.lon or first.lon,
-                    type=s.type,
-                    parent_id=s.parent_id or first.parent_id,
-                    wheelchair=s.wheelchair,
-                    platform_code=s.platform_code or first.platform_code,
-                    external_str_id=s.external_str_id or first.external_str_id,
-                    external_int_id=s.external_int_id or first.external_int_id,
-                )
+                if first.code:
+                    s.code = first.code
+                first.delete = False
+                first.MergeFrom(s)
+                # Enums are taken from the new stop even when zero.
+                first.type = s.type
+                first.wheelchair = s.wheelchair
         return list(sd1.values())
 
     def routes(self, r1: list[gtfs.Route], r2: list[gtfs.Route]) -> list[gtfs.Route]:
         rd1 = {r.route_id: r for r in r1}
         for r in r2:
+            if r.delete:
+                # Deleted routes carry no strings.
+                rd1[r.route_id] = r
+                continue
+
             # Update all strings.
-            for i in range(len(r.long_name)):
-                r.long_name[i] = self.add_string(r.long_name[i])
+            r.long_name[:] = self.add_strings(r.long_name)
             for it in r.itineraries:
+                # Headsign goes first to keep the order of added strings.
                 it.headsign = self.add_string(it.headsign)
-                for i in range(len(it.stop_headsigns)):
-                    it.stop_headsigns[i] = self.add_string(it.stop_headsigns[i])
+                it.stop_headsigns[:] = self.add_strings(it.stop_headsigns)
 
-            if r.delete or r.route_id not in rd1:
+            if r.route_id not in rd1:
                 rd1[r.route_id] = r
             else:
                 first = rd1[r.route_id]
-                rd1[r.route_id] = gtfs.Route(
-                    route_id=r.route_id,
-                    agency_id=r.agency_id or first.agency_id,
-                    short_name=r.short_name or first.short_name,
-                    long_name=r.long_name or first.long_name,
-                    desc=r.desc or first.desc,
-                    type=r.type,
-                    color=r.color,
-                    text_color=r.text_color,
-                    continuous_pickup=r.continuous_pickup,
-                    continuous_dropoff=r.continuous_dropoff,
-                )
-
-                # Now for itineraries.
                 it1 = {i.itinerary_id: i for i in first.itineraries}
                 for it in r.itineraries:
                     it1[it.itinerary_id] = it
-                rd1[r.route_id].itineraries.extend(it1.values())
+                merged = gtfs.Route(itineraries=it1.values())
+
+                # Repeated fields would be appended by MergeFrom, so clear them first.
+                first.ClearField('itineraries')
+                first.ClearField('delete')
+                if r.long_name:
+                    first.ClearField('long_name')
+                r.ClearField('itineraries')
+                merged.MergeFrom(first)
+                merged.MergeFrom(r)
+                merged.type = r.type
+                merged.color = r.color
+                merged.text_color = r.text_color
+                merged.continuous_pickup = r.continuous_pickup
+                merged.continuous_dropoff = r.continuous_dropoff
+                rd1[r.route_id] = merged
         return list(rd1.values())
 
     def trips(self, t1: list[gtfs.Trip], t2: list[gtfs.Trip]) -> list[gtfs.Trip]:
@@ -120,37 +151,23 @@ class DeltaMerger:
                 td1[t.trip_id] = t
             else:
                 first = td1[t.trip_id]
-                new_deps = t.departures or t.arrivals
-                td1[t.trip_id] = gtfs.Trip(
-                    trip_id=t.trip_id,
-                    service_id=t.service_id or first.service_id,
-                    itinerary_id=t.itinerary_id or first.itinerary_id,
-                    short_name=t.short_name or first.short_name,
-                    wheelchair=t.wheelchair,
-                    bikes=t.bikes,
-                    approximate=t.approximate,
-                    departures=t.departures if new_deps else first.departures,
-                    arrivals=t.arrivals if new_deps else first.arrivals,
-                    pickup_types=t.pickup_types or first.pickup_types,
-                    dropoff_types=t.dropoff_types or first.dropoff_types,
-                    start_time=t.start_time or first.start_time,
-                    end_time=t.end_time or first.end_time,
-                    interval=t.interval or first.interval,
-                )
+                if t.departures or t.arrivals:
+                    first.ClearField('departures')
+                    first.ClearField('arrivals')
+                if t.pickup_types:
+                    first.ClearField('pickup_types')
+                if t.dropoff_types:
+                    first.ClearField('dropoff_types')
+                first.MergeFrom(t)
+                first.wheelchair = t.wheelchair
+                first.bikes = t.bikes
+                first.approximate = t.approximate
         return list(td1.values())
 
     def transfers(self, t1: list[gtfs.Transfer],
                   t2: list[gtfs.Transfer]) -> list[gtfs.Transfer]:
-        def transfer_key(t: gtfs.Transfer):
-            return (
-                t.from_stop, t.to_stop,
-                t.from_route, t.to_route,
-                t.from_trip, t.to_trip,
-            )
-
-        td1 = {transfer_key(t): t for t in t1}
-        for t in t2:
-            td1[transfer_key(t)] = t
+        td1 = dict(zip(map(_transfer_key, t1), t1))
+        td1.update(zip(map(_transfer_key, t2), t2))
         return list(td1.values())
 
     def fare_links(self, f1: FareLinks, f2: FareLinks):
@@ -189,10 +206,12 @@ def delta_merge():
 
     for k, v in delta.id_store.items():
         if k in second.id_store:
-            # Append ids from the second delta.
-            for i in range(v.last_id + 1, v.last_id + 1):
-                v.ids[second.id_store[k].original[i]] = i
-            v.last_id = 0 if not v.ids else max(v.ids.values())
+            # Append ids from the second delta. This loop used to iterate
+            # over an empty range, so new ids were lost.
+            last_id = v.last_id
+            v.ids.update((oid, i) for i, oid in second.id_store[k].original.items()
+                         if i > last_id)
+            v.last_id = max(v.ids.values(), default=0)
 
     dm = DeltaMerger(delta.strings, second.strings)
     delta.agencies = dm.agencies(delta.agencies, second.agencies)
@@ -1,6 +1,9 @@
 import argparse
 import sys
 import json
+from collections import Counter
+from collections.abc import Callable, Generator
+from operator import attrgetter
 from typing import Any
 from .wrapper import (
     GtfsProto, gtfs, GtfsDelta, FareLinks, is_gtfs_delta, GtfsBlocks
@@ -30,70 +33,93 @@ BLOCKS = {
     'version': -1,
     'date': -2,
 }
+BLOCK_NAMES = {v: s for s, v in BLOCKS.items()}
+
+
+def _read_varint(data: memoryview, pos: int) -> tuple[int, int]:
+    result = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _scan_fields(data: memoryview) -> Generator[tuple[int, int, int], None, None]:
+    """Walks the wire format, yielding field number and value bounds for each field."""
+    pos = 0
+    end = len(data)
+    while pos < end:
+        tag, pos = _read_varint(data, pos)
+        wire_type = tag & 7
+        if wire_type == 0:
+            _, next_pos = _read_varint(data, pos)
+        elif wire_type == 2:
+            size, pos = _read_varint(data, pos)
+            next_pos = pos + size
+        elif wire_type == 1:
+            next_pos = pos + 8
+        elif wire_type == 5:
+            next_pos = pos + 4
+        else:
+            raise ValueError(f'Unsupported wire type {wire_type}')
+        yield tag >> 3, pos, next_pos
+        pos = next_pos
+
+
+def _count_repeated(data: memoryview, field_no: int) -> int:
+    return sum(1 for f, _, _ in _scan_fields(data) if f == field_no)
+
+
+def _count_entries(data: memoryview) -> dict[str, Any]:
+    # All plain list blocks keep their entries in the field 1.
+    return {'count': _count_repeated(data, 1)}
+
+
+def _count_calendar(data: memoryview) -> dict[str, Any]:
+    counts = Counter(f for f, _, _ in _scan_fields(data))
+    return {'dates': counts[2], 'count': counts[3]}
+
+
+def _count_routes(data: memoryview) -> dict[str, Any]:
+    routes = itineraries = 0
+    for f, start, end in _scan_fields(data):
+        if f == 1:
+            routes += 1
+            itineraries += _count_repeated(data[start:end], 11)
+    return {'count': routes, 'itineraries': itineraries}
+
+
+# Counting tags is enough here, no need to decode the messages.
+# TODO: count fare links.
+_COUNTERS: dict[int, Callable[[memoryview], dict[str, Any]]] = {
+    gtfs.B_AGENCY: _count_entries,
+    gtfs.B_CALENDAR: _count_calendar,
+    gtfs.B_SHAPES: _count_entries,
+    gtfs.B_NETWORKS: _count_entries,
+    gtfs.B_AREAS: _count_entries,
+    gtfs.B_STRINGS: _count_entries,
+    gtfs.B_STOPS: _count_entries,
+    gtfs.B_ROUTES: _count_routes,
+    gtfs.B_TRIPS: _count_entries,
+    gtfs.B_TRANSFERS: _count_entries,
+}
 
 
 def read_count(block: gtfs.Block, data: bytes) -> dict[str, Any]:
-    COUNT = 'count'
-    if block == gtfs.B_AGENCY:
-        agencies = gtfs.Agencies()
-        agencies.ParseFromString(data)
-        return {COUNT: len(agencies.agencies)}
-    elif block == gtfs.B_CALENDAR:
-        calendar = gtfs.Calendar()
-        calendar.ParseFromString(data)
-        return {'dates': len(calendar.dates), COUNT: len(calendar.services)}
-    elif block == gtfs.B_SHAPES:
-        shapes = gtfs.Shapes()
-        shapes.ParseFromString(data)
-        return {COUNT: len(shapes.shapes)}
-    elif block == gtfs.B_NETWORKS:
-        networks = gtfs.Networks()
-        networks.ParseFromString(data)
-        return {COUNT: len(networks.networks)}
-    elif block == gtfs.B_AREAS:
-        areas = gtfs.Areas()
-        areas.ParseFromString(data)
-        return {COUNT: len(areas.areas)}
-    elif block == gtfs.B_STRINGS:
-        strings = gtfs.StringTable()
-        strings.ParseFromString(data)
-        return {COUNT: len(strings.strings)}
-    elif block == gtfs.B_STOPS:
-        stops = gtfs.Stops()
-        stops.ParseFromString(data)
-        return {COUNT: len(stops.stops)}
-    elif block == gtfs.B_ROUTES:
-        routes = gtfs.Routes()
-        routes.ParseFromString(data)
-        return {
-            COUNT: len(routes.routes),
-            'itineraries': sum(len(r.itineraries) for r in routes.routes)
-        }
-    elif block == gtfs.B_TRIPS:
-        trips = gtfs.Trips()
-        trips.ParseFromString(data)
-        return {COUNT: len(trips.trips)}
-    elif block == gtfs.B_TRANSFERS:
-        tr = gtfs.Transfers()
-        tr.ParseFromString(data)
-        return {COUNT: len(tr.transfers)}
-    elif block == gtfs.B_FARE_LINKS:
-        pass  # TODO
-        # fl = gtfs.FareLinks()
-        # fl.ParseFromString(data)
-        # return {
-        #     'stop_zones': len(fl.stop_zone_ids),
-        #     'stop_areas': len(fl.stop_area_ids),
-        #     'route_networks': len(fl.route_network_ids),
-        # }
-    return {}
+    counter = _COUNTERS.get(block)
+    return {} if not counter else counter(memoryview(data))
+
+
+# json.dumps() creates a new encoder for each call with non-default arguments.
+_JSON_ENCODER = json.JSONEncoder(ensure_ascii=False)
 
 
 def print_skip_empty(d: dict[str, Any]):
-    print(json.dumps(
-        {k: v for k, v in d.items() if v is not None and v != ''},
-        ensure_ascii=False
-    ))
+    print(_JSON_ENCODER.encode(
+        {k: v for k, v in d.items() if v is not None and v != ''}))
 
 
 def print_header(header: gtfs.GtfsHeader):
@@ -115,39 +141,33 @@ def print_delta_header(header: gtfs.GtfsDeltaHeader):
 
 
 def print_blocks(blocks: GtfsBlocks, compressed: bool):
-    block_names = {v: s for s, v in BLOCKS.items()}
     for b in blocks.blocks:
         data = blocks.get(b)
         v = {
-            'block': block_names.get(b, str(b)),
+            'block': BLOCK_NAMES.get(b, str(b)),
             'size': len(data),
         }
         if compressed:
             v['compressed'] = len(blocks.blocks[b])
         v.update(read_count(b, data))
+        del data
         print(json.dumps(v))
 
 
 def print_id(ids: gtfs.IdReference):
-    block_names = {v: s for s, v in BLOCKS.items()}
     print_skip_empty({
-        'block': block_names.get(ids.block, str(ids.block)),
+        'block': BLOCK_NAMES.get(ids.block, str(ids.block)),
         'ids': {i: s for i, s in enumerate(ids.ids) if i},
     })
 
 
+_AGENCY_KEYS = ('agency_id', 'original_id', 'name', 'url', 'timezone',
+                'lang', 'phone', 'fare_url', 'email')
+_agency_values = attrgetter(*_AGENCY_KEYS[2:])
+
+
 def print_agency(a: gtfs.Agency, oid: str | None):
-    print_skip_empty({
-        'agency_id': a.agency_id,
-        'original_id': oid,
-        'name': a.name,
-        'url': a.url,
-        'timezone': a.timezone,
-        'lang': a.lang,
-        'phone': a.phone,
-        'fare_url': a.fare_url,
-        'email': a.email,
-    })
+    print_skip_empty(dict(zip(_AGENCY_KEYS, (a.agency_id, oid, *_agency_values(a)))))
 
 
 def print_calendar(c: gtfs.Calendar):
@@ -175,9 +195,33 @@ def print_shape(s: gtfs.Shape, oid: str | None):
     })
 
 
+LOC_TYPES = ('stop', 'station', 'exit', 'node', 'boarding')
+ACC_TYPES = ('unknown', 'some', 'no')
+PD_TYPES = ('no', 'yes', 'phone_agency', 'tell_driver')
+TTYPES = ('possible', 'departure_waits', 'needs_time', 'not_possible',
+          'in_seat', 'in_seat_forbidden')
+ROUTE_TYPES = {
+    0: 'bus',
+    1: 'tram',
+    2: 'subway',
+    3: 'rail',
+    4: 'ferry',
+    5: 'cable_tram',
+    6: 'aerial',
+    7: 'funicular',
+    9: 'communal_taxi',
+    10: 'coach',
+    11: 'trolleybus',
+    12: 'monorail',
+    21: 'urban_rail',
+    22: 'water',
+    23: 'air',
+    24: 'taxi',
+    25: 'misc',
+}
+
+
 def print_stop(s: gtfs.Stop, oid: str | None):
-    LOC_TYPES = ['stop', 'station', 'exit', 'node', 'boarding']
-    ACC_TYPES = ['unknown', 'some', 'no']
     print_skip_empty({
         'stop_id': s.stop_id,
         'original_id': oid,
@@ -206,26 +250,6 @@ def print_route(r: gtfs.Route, oid: str | None):
             'shape_id': i.shape_id or None,
         }.items() if v is not None}
 
-    ROUTE_TYPES = {
-        0: 'bus',
-        1: 'tram',
-        2: 'subway',
-        3: 'rail',
-        4: 'ferry',
-        5: 'cable_tram',
-        6: 'aerial',
-        7: 'funicular',
-        9: 'communal_taxi',
-        10: 'coach',
-        11: 'trolleybus',
-        12: 'monorail',
-        21: 'urban_rail',
-        22: 'water',
-        23: 'air',
-        24: 'taxi',
-        25: 'misc',
-    }
-    PD_TYPES = ['no', 'yes', 'phone_agency', 'tell_driver']
     print_skip_empty({
         'route_id': r.route_id,
         'original_id': oid,
@@ -244,8 +268,6 @@ def print_route(r: gtfs.Route, oid: str | None):
 
 
 def print_trip(t: gtfs.Trip, oid: str | None):
-    ACC_TYPES = ['unknown', 'some', 'no']
-    PD_TYPES = ['no', 'yes', 'phone_agency', 'tell_driver']
     print_skip_empty({
         'trip_id': t.trip_id,
         'original_id': oid,
@@ -265,19 +287,17 @@ def print_trip(t: gtfs.Trip, oid: str | None):
     })
 
 
+_TRANSFER_KEYS = ('from_stop', 'to_stop', 'from_route', 'to_route',
+                  'from_trip', 'to_trip', 'type', 'min_transfer_time')
+_transfer_values = attrgetter(*_TRANSFER_KEYS)
+
+
 def print_transfer(t: gtfs.Transfer):
-    TTYPES = ['possible', 'departure_waits', 'needs_time', 'not_possible',
-              'in_seat', 'in_seat_forbidden']
-    print_skip_empty({
-        'from_stop': t.from_stop or None,
-        'to_stop': t.to_stop or None,
-        'from_route': t.from_route or None,
-        'to_route': t.to_route or None,
-        'from_trip': t.from_trip or None,
-        'to_trip': t.to_trip or None,
-        'type': None if not t.type else TTYPES[t.type],
-        'min_transfer_time': t.min_transfer_time or None,
-    })
+    # All fields are numbers that are skipped when zero.
+    d = {k: v for k, v in zip(_TRANSFER_KEYS, _transfer_values(t)) if v}
+    if 'type' in d:
+        d['type'] = TTYPES[d['type']]
+    print(_JSON_ENCODER.encode(d))
 
 
 def print_fare_links(fl: FareLinks):
@@ -286,6 +306,118 @@ def print_fare_links(fl: FareLinks):
     print(json.dumps({'route_network_ids': fl.route_networks}))
 
 
+Feed = GtfsProto | GtfsDelta
+
+
+def dump_version(feed: Feed, for_id: str | None, int_id: int):
+    print(feed.header.version)
+
+
+def dump_date(feed: Feed, for_id: str | None, int_id: int):
+    print(feed.header.date)
+
+
+def dump_ids(feed: Feed, for_id: str | None, int_id: int):
+    for b, ids in feed.id_store.items():
+        print_skip_empty({
+            'block': BLOCK_NAMES.get(b, str(b)),
+            'ids': ids.original,
+        })
+
+
+def dump_agencies(feed: Feed, for_id: str | None, int_id: int):
+    get_oid = feed.id_store[gtfs.B_AGENCY].original.get
+    for a in feed.agencies:
+        oid = get_oid(a.agency_id)
+        if not for_id or a.agency_id == int_id or oid == for_id:
+            print_agency(a, oid)
+
+
+def dump_calendar(feed: Feed, for_id: str | None, int_id: int):
+    print_calendar(feed.calendar)
+
+
+def dump_shapes(feed: Feed, for_id: str | None, int_id: int):
+    get_oid = feed.id_store[gtfs.B_SHAPES].original.get
+    for s in feed.shapes:
+        oid = get_oid(s.shape_id)
+        if not for_id or s.shape_id == int_id or oid == for_id:
+            print_shape(s, oid)
+
+
+def dump_networks(feed: Feed, for_id: str | None, int_id: int):
+    print(json.dumps(feed.networks, ensure_ascii=False))
+
+
+def dump_areas(feed: Feed, for_id: str | None, int_id: int):
+    print(json.dumps(feed.areas, ensure_ascii=False))
+
+
+def dump_strings(feed: Feed, for_id: str | None, int_id: int):
+    print(json.dumps(
+        {i: s for i, s in enumerate(feed.strings.strings)},
+        ensure_ascii=False
+    ))
+
+
+def dump_stops(feed: Feed, for_id: str | None, int_id: int):
+    get_oid = feed.id_store[gtfs.B_STOPS].original.get
+    for s in feed.stops:
+        oid = get_oid(s.stop_id)
+        if not for_id or s.stop_id == int_id or oid == for_id:
+            print_stop(s, oid)
+
+
+def dump_routes(feed: Feed, for_id: str | None, int_id: int):
+    get_oid = feed.id_store[gtfs.B_ROUTES].original.get
+    for r in feed.routes:
+        oid = get_oid(r.route_id)
+        if not for_id or r.route_id == int_id or oid == for_id:
+            print_route(r, oid)
+
+
+def dump_trips(feed: Feed, for_id: str | None, int_id: int):
+    get_oid = feed.id_store[gtfs.B_TRIPS].original.get
+    for t in feed.trips:
+        oid = get_oid(t.trip_id)
+        if not for_id or t.trip_id == int_id or oid == for_id:
+            print_trip(t, oid)
+
+
+def dump_transfers(feed: Feed, for_id: str | None, int_id: int):
+    for t in feed.transfers:
+        print_transfer(t)
+
+
+def dump_fare_links(feed: Feed, for_id: str | None, int_id: int):
+    print_fare_links(feed.fare_links)
+
+
+def dump_unsupported(feed: Feed, for_id: str | None, int_id: int):
+    print(
+        'Sorry, printing blocks of this type is not implemented yet.',
+        file=sys.stderr
+    )
+
+
+DUMPERS: dict[int, Callable[[Feed, str | None, int], None]] = {
+    BLOCKS['version']: dump_version,
+    BLOCKS['date']: dump_date,
+    gtfs.B_IDS: dump_ids,
+    gtfs.B_AGENCY: dump_agencies,
+    gtfs.B_CALENDAR: dump_calendar,
+    gtfs.B_SHAPES: dump_shapes,
+    gtfs.B_NETWORKS: dump_networks,
+    gtfs.B_AREAS: dump_areas,
+    gtfs.B_STRINGS: dump_strings,
+    gtfs.B_STOPS: dump_stops,
+    gtfs.B_ROUTES: dump_routes,
+    gtfs.B_TRIPS: dump_trips,
+    gtfs.B_TRANSFERS: dump_transfers,
+    gtfs.B_FARE_LINKS: dump_fare_links,
+}
+
+
 def info():
     parser = argparse.ArgumentParser(
         description='Print information and contents of a protobuf-compressed GTFS')
@@ -296,83 +428,23 @@ def info():
     options = parser.parse_args()
 
     if is_gtfs_delta(options.input):
-        feed: GtfsProto | GtfsDelta = GtfsDelta(options.input)
+        feed: Feed = GtfsDelta(options.input)
+        print_feed_header: Callable[[Any], None] = print_delta_header
     else:
         feed = GtfsProto(options.input)
+        print_feed_header = print_header
 
     if not options.block:
         feed.read_all()
-        if isinstance(feed, GtfsDelta):
-            print_delta_header(feed.header)
-        else:
-            print_header(feed.header)
+        print_feed_header(feed.header)
         feed.store_strings()
         feed.store_ids()
         print_blocks(feed.blocks, feed.header.compressed)
 
     else:
-        for_id = options.id
         try:
             int_id = int(options.id or 'none')
         except ValueError:
             int_id = -1
-
-        block = BLOCKS[options.part]
-
-        if options.block == 'version':
-            print(feed.header.version)
-        elif options.block == 'date':
-            print(feed.header.date)
-        elif block == gtfs.B_IDS:
-            block_names = {v: s for s, v in BLOCKS.items()}
-            for b, ids in feed.id_store.items():
-                print_skip_empty({
-                    'block': block_names.get(b, str(b)),
-                    'ids': {i: s for s, i in ids.ids.items()},
-                })
-        elif block == gtfs.B_AGENCY:
-            for a in feed.agencies:
-                oid = feed.id_store[block].original.get(a.agency_id)
-                if not for_id or a.agency_id == int_id or oid == for_id:
-                    print_agency(a, oid)
-        elif block == gtfs.B_CALENDAR:
-            print_calendar(feed.calendar)
-        elif block == gtfs.B_SHAPES:
-            for s in feed.shapes:
-                oid = feed.id_store[block].original.get(s.shape_id)
-                if not for_id or s.shape_id == int_id or oid == for_id:
-                    print_shape(s, oid)
-        elif block == gtfs.B_NETWORKS:
-            print(json.dumps(feed.networks, ensure_ascii=False))
-        elif block == gtfs.B_AREAS:
-            print(json.dumps(feed.areas, ensure_ascii=False))
-        elif block == gtfs.B_STRINGS:
-            print(json.dumps(
-                {i: s for i, s in enumerate(feed.strings.strings)},
-                ensure_ascii=False
-            ))
-        elif block == gtfs.B_STOPS:
-            for s in feed.stops:
-                oid = feed.id_store[block].original.get(s.stop_id)
-                if not for_id or s.stop_id == int_id or oid == for_id:
-                    print_stop(s, oid)
-        elif block == gtfs.B_ROUTES:
-            for r in feed.routes:
-                oid = feed.id_store[block].original.get(r.route_id)
-                if not for_id or r.route_id == int_id or oid == for_id:
-                    print_route(r, oid)
-        elif block == gtfs.B_TRIPS:
-            for t in feed.trips:
-                oid = feed.id_store[block].original.get(t.trip_id)
-                if not for_id or t.trip_id == int_id or oid == for_id:
-                    print_trip(t, oid)
-        elif block == gtfs.B_TRANSFERS:
-            for t in feed.transfers:
-                print_transfer(t)
-        elif block == gtfs.B_FARE_LINKS:
-            print_fare_links(feed.fare_links)
-        else:
-            print(
-                'Sorry, printing blocks of this type is not implemented yet.',
-                file=sys.stderr
-            )
+        dump = DUMPERS.get(BLOCKS[options.block], dump_unsupported)
+        dump(feed, options.id, int_id)
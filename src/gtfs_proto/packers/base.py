@@ -3,14 +3,31 @@ from ..base import IdReference, FareLinks, StringCache
 from abc import ABC, abstractmethod
 from collections.abc import Generator
 from contextlib import contextmanager
-from csv import DictReader
+from csv import reader as csv_reader
 from io import TextIOWrapper
+from operator import itemgetter
 from typing import TextIO, Any
 from zipfile import ZipFile
 
 
 __all__ = ['BasePacker', 'StringCache', 'FareLinks', 'IdReference']
 
+# Sorts buffered (sequence, original id, row) tuples by the sequence number.
+_by_sequence = itemgetter(0)
+
+# Indexed by GTFS values, which differ from our enum.
+_PICKUP_DROPOFF = (
+    gtfs.PickupDropoff.PD_YES,
+    gtfs.PickupDropoff.PD_NO,
+    gtfs.PickupDropoff.PD_PHONE_AGENCY,
+    gtfs.PickupDropoff.PD_TELL_DRIVER,
+)
+_ACCESSIBILITY = {
+    '0': gtfs.A_UNKNOWN,
+    '1': gtfs.A_SOME,
+    '2': gtfs.A_NO,
+}
+
 
 class BasePacker(ABC):
     def __init__(self, z: ZipFile, strings: StringCache, id_store: dict[int, IdReference]):
@@ -40,50 +57,85 @@ class BasePacker(ABC):
         return self.id_store[self.block]
 
     def table_reader(self, fileobj: TextIO, id_column: str,
-                     ids_block: int | None = None
-                     ) -> Generator[tuple[dict, int, str], None, None]:
-        """Iterates over CSV rows and returns (row, our_id, source_id)."""
+                     ids_block: int | None = None,
+                     fields: tuple[str, ...] | None = None,
+                     ) -> Generator[tuple[Any, int, str], None, None]:
+        """
+        Iterates over CSV rows and returns (row, our_id, source_id).
+        When fields are specified, a row is a list of just those values
+        in the same order, with empty strings for missing columns.
+        """
         ids = self.id_store[ids_block or self.block]
-        for row in DictReader(fileobj):
-            yield (
-                {k: v.strip() for k, v in row.items()},
-                ids.add(row[id_column]),
-                row[id_column],
-            )
+        reader = csv_reader(fileobj)
+        columns = next(reader, None)
+        if not columns:
+            return
+        id_idx = columns.index(id_column) if id_column in columns else None
+        # Missing fields point to an empty string appended to each row.
+        field_idx = None if fields is None else [
+            columns.index(f) if f in columns else -1 for f in fields]
+        for values in reader:
+            if not values:
+                continue
+            if id_idx is None:
+                raise KeyError(id_column)
+            if field_idx is None:
+                # Zipping with the header row is cheaper than DictReader building each row.
+                row: Any = dict(zip(columns, map(str.strip, values)))
+            else:
+                values.append('')
+                try:
+                    row = [values[i].strip() for i in field_idx]
+                except IndexError:
+                    # The row is shorter than the header.
+                    row = [values[i].strip() if i < len(values) else '' for i in field_idx]
+            yield row, ids.add(values[id_idx]), values[id_idx]
+
+    def parse_pickup_dropoff(self, value: str | None) -> int:
+        if not value:
+            return gtfs.PickupDropoff.PD_NO  # 0
+        v = int(value)
+        if 0 <= v < len(_PICKUP_DROPOFF):
+            return _PICKUP_DROPOFF[v]
+        raise ValueError(f'Wrong continous pickup / drop_off value: {v}')
+
+    def parse_accessibility(self, value: str | None) -> int:
+        if not value:
+            return 0
+        result = _ACCESSIBILITY.get(value)
+        if result is not None:
+            return result
+        raise ValueError(f'Unknown accessibility value: {value}')
 
     def sequence_reader(self, fileobj: TextIO, id_column: str,
                         seq_column: str, ids_block: int | None = None,
                         max_overlapping: int = 2,
-                        ) -> Generator[tuple[list[dict], int, str], None, None]:
-        cur_ids: list[int] = []
-        cur_lists: list[list[tuple[int, str, dict]]] = []
+                        fields: tuple[str, ...] | None = None,
+                        ) -> Generator[tuple[list[Any], int, str], None, None]:
+        """See table_reader() for the fields parameter. It must include seq_column."""
+        # row_id → rows. Dicts keep insertion order, so the first key is the oldest.
+        cur_lists: dict[int, list[tuple[int, str, Any]]] = {}
         seen_ids: set[int] = set()
-        for row, row_id, orig_id in self.table_reader(fileobj, id_column, ids_block):
-            # Find the row_id index. From the tail, because latest ids are appended there.
-            idx = len(cur_ids) - 1
-            while idx >= 0 and cur_ids[idx] != row_id:
-                idx -= 1
-
-            if idx < 0:
+        seq_key: str | int = seq_column if fields is None else fields.index(seq_column)
+        for row, row_id, orig_id in self.table_reader(fileobj, id_column, ids_block, fields):
+            rows = cur_lists.get(row_id)
+            if rows is None:
                 # Not found: dump the oldest sequence and add the new one.
                 if row_id in seen_ids:
                     raise ValueError(
                         f'Unsorted sequence file, {id_column} {orig_id} is in two parts')
                 seen_ids.add(row_id)
 
-                if len(cur_ids) >= max_overlapping:
-                    last_id = cur_ids.pop(0)
-                    last_rows = cur_lists.pop(0)
-                    last_rows.sort(key=lambda r: r[0])
+                if len(cur_lists) >= max_overlapping:
+                    last_id = next(iter(cur_lists))
+                    last_rows = cur_lists.pop(last_id)
+                    last_rows.sort(key=_by_sequence)
                     yield [r[2] for r in last_rows], last_id, last_rows[0][1]
 
-                cur_ids.append(row_id)
-                cur_lists.append([])
-                idx = len(cur_ids) - 1
+                rows = cur_lists[row_id] = []
 
-            cur_lists[idx].append((int(row[seq_column]), orig_id, row))
+            rows.append((int(row[seq_key]), orig_id, row))
 
-        for i, row_id in enumerate(cur_ids):
-            rows = cur_lists[i]
-            rows.sort(key=lambda r: r[0])
+        for row_id, rows in cur_lists.items():
+            rows.sort(key=_by_sequence)
             yield [r[2] for r in rows], row_id, rows[0][1]
@@ -6,6 +6,10 @@ from . import BasePacker
 from .. import StringCache, IdReference, int_to_date, gtfs, CalendarService, build_calendar
 
 
+_WEEKDAY_COLUMNS = (
+    'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+
 class CalendarDates:
     def __init__(self):
         self.added: dict[int, list[date]] = defaultdict(list)
@@ -36,8 +40,9 @@ class CalendarPacker(BasePacker):
     def read_calendar_dates(self, fileobj: TextIO) -> CalendarDates:
         dates = CalendarDates()
         for row, service_id, _ in self.table_reader(fileobj, 'service_id'):
-            value = int_to_date(int(row['date'].strip()))
-            if row['exception_type'].strip() == '1':
+            # Values are already stripped by table_reader.
+            value = int_to_date(int(row['date']))
+            if row['exception_type'] == '1':
                 dates.added[service_id].append(value)
             else:
                 dates.removed[service_id].append(value)
@@ -50,20 +55,15 @@ class CalendarPacker(BasePacker):
         if fileobj:
             # First just read everything, to detect the base date.
             for row, service_id, _ in self.table_reader(fileobj, 'service_id'):
-                s = CalendarService(service_id=service_id)
-                if row['start_date']:
-                    s.start_date = int_to_date(int(row['start_date']))
-                if row['end_date']:
-                    s.end_date = int_to_date(int(row['end_date']))
-                weekdays: list[bool] = []
-                for i, k in enumerate((
-                        'monday', 'tuesday', 'wednesday', 'thursday',
-                        'friday', 'saturday', 'sunday')):
-                    weekdays.append(row[k] == '1')
-                s.weekdays = weekdays
-                s.added_days = dates.added.get(service_id, [])
-                s.removed_days = dates.removed.get(service_id, [])
-                services.append(s)
+                services.append(CalendarService(
+                    service_id=service_id,
+                    start_date=(None if not row['start_date']
+                                else int_to_date(int(row['start_date']))),
+                    end_date=None if not row['end_date'] else int_to_date(int(row['end_date'])),
+                    weekdays=[row[k] == '1' for k in _WEEKDAY_COLUMNS],
+                    added_days=dates.added.get(service_id),
+                    removed_days=dates.removed.get(service_id),
+                ))
                 seen_ids.add(service_id)
 
         # Adding stubs for each service_id that's missing in the calendar.
@@ -1,12 +1,27 @@
+import re
+import sys
+from array import array
 from .base import BasePacker, StringCache, IdReference, FareLinks
 from typing import TextIO
 from zipfile import ZipFile
 from collections import defaultdict
 from dataclasses import dataclass
+from functools import lru_cache
 from hashlib import md5
 from .. import gtfs_pb2 as gtfs
 
 
+# Separates parts in route long names, like "A - B — C".
+_LONG_NAME_SPLIT = re.compile(' [-—–] ')
+_DASHES = str.maketrans('—–', '--')
+
+
+@lru_cache(maxsize=4096)
+def parse_color(value: str) -> int:
+    # Feeds use only a handful of colors, so this is mostly a cache hit.
+    return int(value, 16)
+
+
 @dataclass
 class StopData:
     seq_id: int
@@ -15,27 +30,34 @@ class StopData:
 
 
 class Trip:
+    __slots__ = ('trip_id', 'route_id', 'headsign', 'opposite', 'stops', 'shape_id',
+                 'headsigns')
+
     def __init__(self, trip_id: int, row: dict[str, str],
                  stops: list[StopData], shape_id: int | None):
         self.trip_id = trip_id
+        self.route_id = row['route_id']
         self.headsign = row.get('trip_headsign')
         self.opposite = row.get('direction_id') == '1'
-        self.stops = [s.stop_id for s in stops]
+        # Stop ids are uint32 in the protobuf, so a typed array keeps them compact.
+        self.stops = array('I', (s.stop_id for s in stops))
         self.shape_id = shape_id
         self.headsigns = [s.headsign for s in stops]
 
-        # Generate stops key.
-        m = md5(usedforsecurity=False)
-        m.update(row['route_id'].encode())
-        for s in self.stops:
-            m.update(s.to_bytes(4))
-        self.stops_key = m.hexdigest()
-
-    def __hash__(self) -> int:
-        return hash(self.stops_key)
-
-    def __eq__(self, other):
-        return self.stops_key == other.stops_key
+    @property
+    def itinerary_key(self) -> str:
+        """
+        Itinerary key for the id table. It must stay the same between versions,
+        so it is a digest of the route id and all stops, not a Python hash.
+        """
+        m = md5(self.route_id.encode(), usedforsecurity=False)
+        # Stop ids are hashed as big-endian 32-bit values.
+        stops = self.stops
+        if sys.byteorder == 'little':
+            stops = array('I', stops)
+            stops.byteswap()
+        m.update(stops)
+        return m.hexdigest()
 
 
 class RoutesPacker(BasePacker):
@@ -87,11 +109,11 @@ class RoutesPacker(BasePacker):
                 route.desc = row['route_desc']
             route.type = self.route_type_to_enum(int(row['route_type']))
             if row.get('route_color', '') and row['route_color'].upper() != 'FFFFFF':
-                route.color = int(row['route_color'], 16)
+                route.color = parse_color(row['route_color'])
                 if route.color == 0:
                     route.color = 0xFFFFFF
             if row.get('route_text_color', '') and row['route_text_color'] != '000000':
-                route.text_color = int(row['route_text_color'], 16)
+                route.text_color = parse_color(row['route_text_color'])
             route.continuous_pickup = self.parse_pickup_dropoff(row.get('continuous_pickup'))
             route.continuous_dropoff = self.parse_pickup_dropoff(row.get('continuous_drop_off'))
 
@@ -104,51 +126,58 @@ class RoutesPacker(BasePacker):
 
     def read_itineraries(self, fileobj: TextIO, trip_stops: dict[int, list[StopData]]
                          ) -> tuple[dict[str, list[gtfs.RouteItinerary]], dict[int, int]]:
-        trips: dict[str, list[Trip]] = defaultdict(list)  # route_id -> list[Trip]
+        result: dict[str, list[gtfs.RouteItinerary]] = defaultdict(list)
+        trip_itineraries: dict[int, int] = {}
+        shape_ids = self.id_store[gtfs.B_SHAPES].ids
+
+        # Trips are deduplicated as they come: only the first trip with a given
+        # route and sequence of stops makes an itinerary, others just refer to it.
+        # Deduplicating on a tuple is cheaper than hashing every trip.
+        seen: dict[tuple[str, tuple[int, ...]], int] = {}
         for row, trip_id, orig_trip_id in self.table_reader(fileobj, 'trip_id', gtfs.B_TRIPS):
             stops = trip_stops.get(trip_id)
             if not stops:
                 continue
-            shape_id = (None if not row.get('shape_id')
-                        else self.id_store[gtfs.B_SHAPES].ids[row['shape_id']])
-            trips[row['route_id']].append(Trip(trip_id, row, stops, shape_id))
+            route_id = row['route_id']
+            key = (route_id, tuple(s.stop_id for s in stops))
+            itinerary_id = seen.get(key)
+            if itinerary_id is None:
+                shape_id = None if not row.get('shape_id') else shape_ids[row['shape_id']]
+                itinerary_id = self.add_itinerary(
+                    Trip(trip_id, row, stops, shape_id), result[route_id])
+                seen[key] = itinerary_id
+            trip_itineraries[trip_id] = itinerary_id
 
-        # Now we have a list of itinerary-type trips which we need to deduplicate.
+        return result, trip_itineraries
+
+    def add_itinerary(self, trip: Trip, itineraries: list[gtfs.RouteItinerary]) -> int:
         # Note: since we don't have original ids, we need to keep them stable.
         # Since the only thing that matters is an order of stops, we use stops' hash as the key.
-
-        result: dict[str, list[gtfs.RouteItinerary]] = defaultdict(list)
-        trip_itineraries: dict[int, int] = {}
-        ids = self.id_store[gtfs.B_ITINERARIES]
-
-        for route_id, trip_list in trips.items():
-            for trip in set(trip_list):
-                itin = gtfs.RouteItinerary(
-                    itinerary_id=ids.add(trip.stops_key),
-                    opposite_direction=trip.opposite,
-                    stops=trip.stops,
-                    shape_id=trip.shape_id,
-                )
-                if trip.headsign:
-                    itin.headsign = self.strings.add(trip.headsign)
-
-                result[route_id].append(itin)
-                for t in trip_list:
-                    if t.stops_key == trip.stops_key:
-                        trip_itineraries[t.trip_id] = itin.itinerary_id
-
-        return result, trip_itineraries
+        itinerary_id = self.id_store[gtfs.B_ITINERARIES].add(trip.itinerary_key)
+        itin = gtfs.RouteItinerary(
+            itinerary_id=itinerary_id,
+            opposite_direction=trip.opposite,
+            stops=trip.stops,
+            shape_id=trip.shape_id,
+        )
+        if trip.headsign:
+            itin.headsign = self.strings.add(trip.headsign)
+        itineraries.append(itin)
+        return itinerary_id
 
     def read_trip_stops(self, fileobj: TextIO) -> dict[int, list[StopData]]:
         trip_stops: dict[int, list[StopData]] = {}  # trip_id -> int_stop_id, string_id
+        stop_ids = self.id_store[gtfs.B_STOPS].ids
+        add_string = self.strings.add
         for rows, trip_id, orig_trip_id in self.sequence_reader(
-                fileobj, 'trip_id', 'stop_sequence', gtfs.B_TRIPS):
+                fileobj, 'trip_id', 'stop_sequence', gtfs.B_TRIPS,
+                fields=('stop_sequence', 'stop_id', 'stop_headsign')):
             trip_stops[trip_id] = [StopData(
-                seq_id=int(row['stop_sequence']),
+                seq_id=int(seq_id),
                 # The stop should be already in the table.
-                stop_id=self.id_store[gtfs.B_STOPS].ids[row['stop_id']],
-                headsign=self.strings.add(row.get('stop_headsign')),
-            ) for row in rows]
+                stop_id=stop_ids[stop_id],
+                headsign=add_string(headsign),
+            ) for seq_id, stop_id, headsign in rows]
         return trip_stops
 
     def route_type_to_enum(self, t: int) -> int:
@@ -176,7 +205,7 @@ class RoutesPacker(BasePacker):
             return gtfs.RouteType.TROLLEYBUS
         if t == 12 or t == 405:
             return gtfs.RouteType.MONORAIL
-        if t in (400, 403, 403):
+        if t in (400, 403, 404):
             return gtfs.RouteType.URBAN_RAIL
         if t == 1000:
             return gtfs.RouteType.WATER
@@ -191,27 +220,13 @@ class RoutesPacker(BasePacker):
     def parse_route_long_name(self, name: str) -> list[int]:
         if not name:
             return []
-        name = name.replace('—', '-').replace('–', '-')
-        parts = [s.strip() for s in name.split(' - ') if s.strip()]
-        idx = [self.strings.search(p) for p in parts]
-        if not any(idx) or len(parts) == 1:
-            return [self.strings.add(name)]
-        for i in range(len(idx)):
-            if not idx[i]:
-                idx[i] = self.strings.add(parts[i])
+        parts = [p.translate(_DASHES) for p in (s.strip() for s in _LONG_NAME_SPLIT.split(name))
+                 if p]
+        add = self.strings.add
+        if len(parts) == 1:
+            return [add(name.translate(_DASHES))]
+        idx = self.strings.search_many(parts)
+        if not any(idx):
+            return [add(name.translate(_DASHES))]
         # TODO: Check when parts are capitalized
-        return idx  # type: ignore
-
-    def parse_pickup_dropoff(self, value: str | None) -> int:
-        if not value:
-            return 0
-        v = int(value)
-        if v == 0:
-            return gtfs.PickupDropoff.PD_YES
-        if v == 1:
-            return gtfs.PickupDropoff.PD_NO
-        if v == 2:
-            return gtfs.PickupDropoff.PD_PHONE_AGENCY
-        if v == 3:
-            return gtfs.PickupDropoff.PD_TELL_DRIVER
-        raise ValueError(f'Wrong continous pickup / drop_off value: {v}')
+        return [i or add(p) for i, p in zip(idx, parts)]
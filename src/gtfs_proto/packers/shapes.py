@@ -16,11 +16,11 @@ class ShapesPacker(BasePacker):
         result: list[gtfs.Shape] = []
         with self.open_table('shapes') as f:
             for rows, shape_id, _ in self.sequence_reader(
-                    f, 'shape_id', 'shape_pt_sequence', max_overlapping=1):
+                    f, 'shape_id', 'shape_pt_sequence', max_overlapping=1,
+                    fields=('shape_pt_sequence', 'shape_pt_lon', 'shape_pt_lat')):
                 if len(rows) >= 2:
                     result.append(build_shape(
                         shape_id=shape_id,
-                        coords=[(float(row['shape_pt_lon']), float(row['shape_pt_lat']))
-                                for row in rows],
+                        coords=[(float(lon), float(lat)) for _, lon, lat in rows],
                     ))
         return result
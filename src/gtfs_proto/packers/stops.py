@@ -4,6 +4,17 @@ from zipfile import ZipFile
 from .. import gtfs_pb2 as gtfs
 
 
+# Indexed by GTFS location_type values.
+_LOCATION_TYPES = (gtfs.L_STOP, gtfs.L_STATION, gtfs.L_EXIT, gtfs.L_NODE, gtfs.L_BOARDING)
+
+# Columns read from stops.txt, in the order prepare() unpacks them.
+_FIELDS = (
+    'stop_code', 'stop_name', 'stop_desc', 'stop_lat', 'stop_lon', 'zone_id',
+    'location_type', 'parent_station', 'stop_timezone', 'wheelchair_boarding',
+    'platform_code',
+)
+
+
 class StopsPacker(BasePacker):
     def __init__(self, z: ZipFile, strings: StringCache, id_store: dict[int, IdReference],
                  fl: FareLinks):
@@ -26,32 +37,39 @@ class StopsPacker(BasePacker):
         stops: list[gtfs.Stop] = []
         last_lat: float = 0
         last_lon: float = 0
-        for row, stop_id, orig_stop_id in self.table_reader(fileobj, 'stop_id'):
+        add_string = self.strings.add
+        zone_ids = self.id_store[gtfs.B_ZONES]
+        stop_zones = self.fl.stop_zones
+        parse_location_type = self.parse_location_type
+        parse_accessibility = self.parse_accessibility
+        add_id = self.ids.add
+        for row, stop_id, orig_stop_id in self.table_reader(fileobj, 'stop_id', fields=_FIELDS):
+            (code, name, desc, lat, lon, zone_id, location_type,
+             parent_station, timezone, wheelchair, platform_code) = row
             stop = gtfs.Stop(stop_id=stop_id)
-            if row.get('stop_code'):
-                stop.code = row['stop_code']
-            if row['stop_name']:
-                stop.name = self.strings.add(row['stop_name'])
-            if row.get('stop_desc'):
-                stop.desc = row['stop_desc']
-            if row.get('stop_lat'):
+            if code:
+                stop.code = code
+            if name:
+                stop.name = add_string(name)
+            if desc:
+                stop.desc = desc
+            if lat:
                 # Actually we don't know what happens when it's missing.
-                new_lat = round(float(row['stop_lat']) * 1e5)
-                new_lon = round(float(row['stop_lon']) * 1e5)
+                new_lat = round(float(lat) * 1e5)
+                new_lon = round(float(lon) * 1e5)
                 stop.lat = new_lat - last_lat
                 stop.lon = new_lon - last_lon
                 last_lat, last_lon = new_lat, new_lon
-            if row.get('zone_id'):
-                self.fl.stop_zones[stop_id] = self.id_store[gtfs.B_ZONES].add(row['zone_id'])
-            stop.type = self.parse_location_type(row.get('location_type'))
-            pstid = row.get('parent_station')
-            if pstid:
-                stop.parent_id = self.ids.add(pstid)
-            if row.get('stop_timezone'):
-                raise Exception(f'Time to implement time zones! {row["stop_timezone"]}')
-            stop.wheelchair = self.parse_accessibility(row.get('wheelchair_boarding'))
-            if row.get('platform_code'):
-                stop.platform_code = row['platform_code']
+            if zone_id:
+                stop_zones[stop_id] = zone_ids.add(zone_id)
+            stop.type = parse_location_type(location_type)
+            if parent_station:
+                stop.parent_id = add_id(parent_station)
+            if timezone:
+                raise Exception(f'Time to implement time zones! {timezone}')
+            stop.wheelchair = parse_accessibility(wheelchair)
+            if platform_code:
+                stop.platform_code = platform_code
             stops.append(stop)
         return stops
 
@@ -63,25 +81,6 @@ class StopsPacker(BasePacker):
         if not value:
             return 0
         v = int(value)
-        if v == 0:
-            return gtfs.L_STOP
-        if v == 1:
-            return gtfs.L_STATION
-        if v == 2:
-            return gtfs.L_EXIT
-        if v == 3:
-            return gtfs.L_NODE
-        if v == 4:
-            return gtfs.L_BOARDING
+        if 0 <= v < len(_LOCATION_TYPES):
+            return _LOCATION_TYPES[v]
         raise ValueError(f'Unknown location type for a stop: {v}')
-
-    def parse_accessibility(self, value: str | None) -> int:
-        if not value:
-            return 0
-        if value == '0':
-            return gtfs.A_UNKNOWN
-        if value == '1':
-            return gtfs.A_SOME
-        if value == '2':
-            return gtfs.A_NO
-        raise ValueError(f'Unknown accessibility value for a stop: {value}')
@@ -6,6 +6,17 @@ from math import ceil
 from .. import gtfs_pb2 as gtfs
 
 
+# Indexed by GTFS transfer_type values.
+_TRANSFER_TYPES = (
+    gtfs.T_POSSIBLE,
+    gtfs.T_DEPARTURE_WAITS,
+    gtfs.T_NEEDS_TIME,
+    gtfs.T_NOT_POSSIBLE,
+    gtfs.T_IN_SEAT,
+    gtfs.T_IN_SEAT_FORBIDDEN,
+)
+
+
 class TransfersPacker(BasePacker):
     def __init__(self, z: ZipFile, strings: StringCache, id_store: dict[int, IdReference]):
         super().__init__(z, strings, id_store)
@@ -63,16 +74,6 @@ class TransfersPacker(BasePacker):
         if not value:
             return 0
         v = int(value.strip())
-        if v == 0:
-            return gtfs.T_POSSIBLE
-        if v == 1:
-            return gtfs.T_DEPARTURE_WAITS
-        if v == 2:
-            return gtfs.T_NEEDS_TIME
-        if v == 3:
-            return gtfs.T_NOT_POSSIBLE
-        if v == 4:
-            return gtfs.T_IN_SEAT
-        if v == 5:
-            return gtfs.T_IN_SEAT_FORBIDDEN
+        if 0 <= v < len(_TRANSFER_TYPES):
+            return _TRANSFER_TYPES[v]
         raise ValueError(f'Unknown transfer type: {v}')
@@ -2,6 +2,8 @@ from .base import BasePacker, StringCache, IdReference
 from typing import TextIO
 from zipfile import ZipFile
 from dataclasses import dataclass
+from functools import lru_cache
+from operator import attrgetter
 from .. import gtfs_pb2 as gtfs
 
 
@@ -15,6 +17,22 @@ class StopTime:
     approximate: bool
 
 
+_by_seq_id = attrgetter('seq_id')
+
+
+@lru_cache(maxsize=65536)
+def parse_time(tim: str) -> int | None:
+    # Stop times repeat a lot across trips, so this is mostly a cache hit.
+    tim = tim.strip()
+    if not tim:
+        return None
+    if len(tim) == 7:
+        tim = '0' + tim
+    if len(tim) != 8:
+        raise ValueError(f'Wrong time value: {tim}')
+    return int(tim[:2]) * 3600 + int(tim[3:5]) * 60 + int(tim[6:])
+
+
 class TripsPacker(BasePacker):
     def __init__(self, z: ZipFile, strings: StringCache, id_store: dict[int, IdReference],
                  trip_itineraries: dict[int, int]):
@@ -37,58 +55,61 @@ class TripsPacker(BasePacker):
 
     def read_trips(self, fileobj: TextIO) -> dict[int, gtfs.Trip]:
         trips: dict[int, gtfs.Trip] = {}
+        trip_itineraries = self.trip_itineraries
+        service_ids = self.id_store[gtfs.B_CALENDAR].ids
+        parse_accessibility = self.parse_accessibility
         for row, trip_id, _ in self.table_reader(fileobj, 'trip_id'):
             # Skip trips without stops.
-            if trip_id not in self.trip_itineraries:
+            itinerary_id = trip_itineraries.get(trip_id)
+            if itinerary_id is None:
                 continue
 
             trips[trip_id] = gtfs.Trip(
                 trip_id=trip_id,
-                service_id=self.id_store[gtfs.B_CALENDAR].ids[row['service_id']],
-                itinerary_id=self.trip_itineraries[trip_id],
+                service_id=service_ids[row['service_id']],
+                itinerary_id=itinerary_id,
                 short_name=row.get('trip_short_name'),
-                wheelchair=self.parse_accessibility(row.get('wheelchair_accessible')),
-                bikes=self.parse_accessibility(row.get('bikes_allowed')),
+                wheelchair=parse_accessibility(row.get('wheelchair_accessible')),
+                bikes=parse_accessibility(row.get('bikes_allowed')),
             )
         return trips
 
     def from_stop_times(self, fileobj: TextIO, trips: dict[int, gtfs.Trip]):
+        parse_pickup_dropoff = self.parse_pickup_dropoff
         for rows, trip_id, orig_trip_id in self.sequence_reader(
-                fileobj, 'trip_id', 'stop_sequence', gtfs.B_TRIPS):
+                fileobj, 'trip_id', 'stop_sequence', gtfs.B_TRIPS, fields=(
+                    'arrival_time', 'departure_time', 'stop_sequence',
+                    'continuous_pickup', 'continuous_drop_off', 'timepoint')):
             cur_times: list[StopTime] = []
-            for row in rows:
-                arrival = self.parse_time(row['arrival_time']) or 0
+            for arr_time, dep_time, seq_id, pickup, dropoff, timepoint in rows:
+                arrival = parse_time(arr_time) or 0
                 arrival = round(arrival / 5)
-                departure = self.parse_time(row['departure_time']) or 0
+                departure = parse_time(dep_time) or 0
                 if departure:
                     departure = round(departure / 5)
                 elif arrival:
                     departure = arrival
                 cur_times.append(StopTime(
-                    seq_id=int(row['stop_sequence']),
+                    seq_id=int(seq_id),
                     arrival=arrival,
                     departure=departure,
-                    pickup=self.parse_pickup_dropoff(row.get('continuous_pickup')),
-                    dropoff=self.parse_pickup_dropoff(row.get('continuous_drop_off')),
-                    approximate=row.get('timepoint') == '0',
+                    pickup=parse_pickup_dropoff(pickup),
+                    dropoff=parse_pickup_dropoff(dropoff),
+                    approximate=timepoint == '0',
                 ))
             self.fill_trip(trips[trip_id], cur_times)
 
     def fill_trip(self, trip: gtfs.Trip, times: list[StopTime]):
-        times.sort(key=lambda t: t.seq_id)
+        times.sort(key=_by_seq_id)
         if trip.arrivals or trip.departures:
             raise ValueError(f'Trip was already filled: {self.ids.original[trip.trip_id]}')
-        arrivals: list[int] = []
-        for i in range(len(times)):
-            a = times[i].arrival
-            d = times[i].departure
-            # Departures is the main list, arrivals is the auxillary.
-            if i == 0 or d == 0:
-                trip.departures.append(d)
-            else:
-                trip.departures.append(d - times[i-1].departure)
-            # d - a >= 0 because if d == 0, we set it to arrival time in from_stop_times().
-            arrivals.append(0 if not a else d - a)
+        deps = [t.departure for t in times]
+        # Departures is the main list, arrivals is the auxillary.
+        departures = deps[:1]
+        departures.extend(d - prev if d else 0 for prev, d in zip(deps, deps[1:]))
+        # d - a >= 0 because if d == 0, we set it to arrival time in from_stop_times().
+        arrivals = [d - t.arrival if t.arrival else 0 for t, d in zip(times, deps)]
+        trip.departures.extend(departures)
         trip.arrivals.extend(self.cut_empty(arrivals, 0))
         trip.pickup_types.extend(self.cut_empty([t.pickup for t in times], 0))
         trip.dropoff_types.extend(self.cut_empty([t.dropoff for t in times], 0))
@@ -98,49 +119,15 @@ class TripsPacker(BasePacker):
         i = len(values)
         while i > 0 and values[i - 1] == zero:
             i -= 1
-        return values[:i]
+        # Most lists have no trailing zeros, so do not copy them.
+        return values if i == len(values) else values[:i]
 
     def from_frequencies(self, fileobj: TextIO, trips: dict[int, gtfs.Trip]):
         for row, trip_id, _ in self.table_reader(fileobj, 'trip_id'):
             trip = trips[trip_id]  # assuming it's there
-            start = self.parse_time(row['start_time']) or 0
-            end = self.parse_time(row['end_time']) or 0
+            start = parse_time(row['start_time']) or 0
+            end = parse_time(row['end_time']) or 0
             trip.start_time = round(start / 60)
             trip.end_time = round(end / 60)
             trip.interval = int(row['headway_secs'])
             trip.approximate = row.get('exact_times') == '1'
-
-    def parse_time(self, tim: str) -> int | None:
-        tim = tim.strip()
-        if not tim:
-            return None
-        if len(tim) == 7:
-            tim = '0' + tim
-        if len(tim) != 8:
-            raise ValueError(f'Wrong time value: {tim}')
-        return int(tim[:2]) * 3600 + int(tim[3:5]) * 60 + int(tim[6:])
-
-    def parse_accessibility(self, value: str | None) -> int:
-        if not value:
-            return 0
-        if value == '0':
-            return gtfs.A_UNKNOWN
-        if value == '1':
-            return gtfs.A_SOME
-        if value == '2':
-            return gtfs.A_NO
-        raise ValueError(f'Unknown accessibility value for a trip: {value}')
-
-    def parse_pickup_dropoff(self, value: str | None) -> int:
-        if not value:
-            return gtfs.PickupDropoff.PD_NO  # 0
-        v = int(value)
-        if v == 0:
-            return gtfs.PickupDropoff.PD_YES
-        if v == 1:
-            return gtfs.PickupDropoff.PD_NO
-        if v == 2:
-            return gtfs.PickupDropoff.PD_PHONE_AGENCY
-        if v == 3:
-            return gtfs.PickupDropoff.PD_TELL_DRIVER
-        raise ValueError(f'Wrong continous pickup / drop_off value: {v}')
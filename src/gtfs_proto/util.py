@@ -1,21 +1,27 @@
 from datetime import date, timedelta
+from itertools import accumulate
+from collections.abc import Iterable
 from . import gtfs_pb2 as gtfs
 from .wrapper import SHAPE_SCALE
 
 
+# Weekday flags for every possible value of the weekdays bitmask.
+_WEEKDAYS = tuple(tuple((b >> i) & 1 == 1 for i in range(7)) for b in range(128))
+
+
 class CalendarService:
     def __init__(self, service_id: int,
                  start_date: date | None = None,
                  end_date: date | None = None,
                  weekdays: list[bool] | None = None,
-                 added_days: list[date] | None = None,
-                 removed_days: list[date] | None = None):
+                 added_days: Iterable[date] | None = None,
+                 removed_days: Iterable[date] | None = None):
         self.service_id = service_id
         self.start_date = start_date
         self.end_date = end_date
         self.weekdays = weekdays or [False] * 7
-        self.added_days = added_days or []
-        self.removed_days = removed_days or []
+        self.added_days = frozenset(added_days or ())
+        self.removed_days = frozenset(removed_days or ())
 
     def operates(self, on: date | None = None) -> bool:
         if not on:
@@ -31,10 +37,12 @@ class CalendarService:
         return self.weekdays[on.weekday()]
 
     def equals(self, other, base_date: date | None = None) -> bool:
-        def cut(dates: list[date], base_date: date | None) -> list[date]:
-            if not base_date:
-                return dates
-            return [d for d in dates if d > base_date]
+        def same_after(a: frozenset[date], b: frozenset[date], base_date: date | None) -> bool:
+            # Only the dates present in one of the sets can make a difference.
+            diff = a ^ b
+            if not diff or not base_date:
+                return not diff
+            return all(d <= base_date for d in diff)
 
         def cap(d: date | None, base_date: date | None) -> date | None:
             if not d or not base_date or d > base_date:
@@ -49,9 +57,9 @@ class CalendarService:
             return False
         if self.weekdays != other.weekdays:
             return False
-        if cut(other.added_days, base_date) != cut(self.added_days, base_date):
+        if not same_after(other.added_days, self.added_days, base_date):
             return False
-        if cut(other.removed_days, base_date) != cut(self.removed_days, base_date):
+        if not same_after(other.removed_days, self.removed_days, base_date):
             return False
         return True
 
@@ -64,24 +72,20 @@ def int_to_date(d: int) -> date:
 
 
 def parse_calendar(c: gtfs.Calendar) -> list[CalendarService]:
-    def add_base_date(d: list[int], base_date: date) -> list[date]:
-        result: list[date] = []
-        for i, dint in enumerate(d):
-            if i == 0:
-                result.append(base_date + timedelta(days=dint))
-            else:
-                result.append(result[-1] + timedelta(days=dint))
-        return result
+    def add_base_date(d: list[int], base_ord: int) -> list[date]:
+        # Summing ordinals avoids a timedelta per date.
+        return [date.fromordinal(base_ord + o) for o in accumulate(d)]
 
     base_date = int_to_date(c.base_date)
-    dates = {i: add_base_date(d.dates, base_date) for i, d in enumerate(c.dates)}
+    base_ord = base_date.toordinal()
+    dates = {i: add_base_date(d.dates, base_ord) for i, d in enumerate(c.dates)}
     result = []
     for s in c.services:
         result.append(CalendarService(
             service_id=s.service_id,
             start_date=None if not s.start_date else base_date + timedelta(days=s.start_date),
             end_date=None if not s.end_date else base_date + timedelta(days=s.end_date),
-            weekdays=[s.weekdays & (1 << i) > 0 for i in range(7)],
+            weekdays=list(_WEEKDAYS[s.weekdays & 0x7F]),
             added_days=dates[s.added_days],
             removed_days=dates[s.removed_days],
         ))
@@ -93,7 +97,7 @@ def build_calendar(services: list[CalendarService],
     def to_int(d: date | None) -> int:
         return 0 if not d else int(d.strftime('%Y%m%d'))
 
-    def pack_dates(dates: list[date], base_date: date) -> list[int]:
+    def pack_dates(dates: Iterable[date], base_date: date) -> list[int]:
         result: list[int] = []
         prev = base_date
         for d in sorted(dates):
@@ -102,24 +106,14 @@ def build_calendar(services: list[CalendarService],
                 prev = d
         return result
 
-    def find_or_add(dates: list[int], data: list[list[int]]) -> int:
-        """Modifies the data!"""
-        for i, stored in enumerate(data):
-            if len(stored) == len(dates):
-                found = True
-                for j, v in enumerate(dates):
-                    if v != stored[j]:
-                        found = False
-                        break
-                if found:
-                    return i
-        data.append(dates)
-        return len(data) - 1
+    def find_or_add(packed: list[int]) -> int:
+        return dates.setdefault(tuple(packed), len(dates))
 
     if not base_date:
         base_date = date.today() - timedelta(days=2)
 
-    dates: list[list[int]] = [[]]
+    # Packed date lists → their index. Dicts keep insertion order.
+    dates: dict[tuple[int, ...], int] = {(): 0}
     c = gtfs.Calendar(base_date=to_int(base_date))
     for s in services:
         if not s.end_date:
@@ -135,32 +129,30 @@ def build_calendar(services: list[CalendarService],
                         else (s.start_date - base_date).days),
             end_date=(end_date - base_date).days,
             weekdays=sum(1 << i for i in range(7) if s.weekdays[i]),
-            added_days=find_or_add(pack_dates(s.added_days, base_date), dates),
-            removed_days=find_or_add(pack_dates(s.removed_days, base_date), dates),
+            added_days=find_or_add(pack_dates(s.added_days, base_date)),
+            removed_days=find_or_add(pack_dates(s.removed_days, base_date)),
         ))
-    for d in dates:
-        c.dates.append(gtfs.CalendarDates(dates=d))
+    c.dates.extend(gtfs.CalendarDates(dates=d) for d in dates)
     return c
 
 
 def parse_shape(shape: gtfs.Shape) -> list[tuple[float, float]]:
-    last_coord = (0, 0)
-    coords: list[tuple[float, float]] = []
-    for i in range(len(shape.longitudes)):
-        c = (shape.longitudes[i] + last_coord[0], shape.latitudes[i] + last_coord[1])
-        coords.append((c[0] / SHAPE_SCALE, c[1] / SHAPE_SCALE))
-        last_coord = c
-    return coords
+    # Iterate over the repeated fields once instead of indexing them.
+    return [(lon / SHAPE_SCALE, lat / SHAPE_SCALE) for lon, lat in zip(
+        accumulate(shape.longitudes), accumulate(shape.latitudes))]
 
 
 def build_shape(shape_id: int, coords: list[tuple[float, float]]) -> gtfs.Shape:
     if len(coords) < 2:
         raise Exception(f'Got {len(coords)} coords for shape {shape_id}')
-    shape = gtfs.Shape(shape_id=shape_id)
-    last_coord = (0, 0)
-    for c in coords:
-        new_coord = (round(c[0] * SHAPE_SCALE), round(c[1] * SHAPE_SCALE))
-        shape.longitudes.append(new_coord[0] - last_coord[0])
-        shape.latitudes.append(new_coord[1] - last_coord[1])
-        last_coord = new_coord
-    return shape
+    longitudes: list[int] = []
+    latitudes: list[int] = []
+    last_lon = last_lat = 0
+    for c_lon, c_lat in coords:
+        lon = round(c_lon * SHAPE_SCALE)
+        lat = round(c_lat * SHAPE_SCALE)
+        longitudes.append(lon - last_lon)
+        latitudes.append(lat - last_lat)
+        last_lon, last_lat = lon, lat
+    # Filling the repeated fields at once is cheaper than appending one by one.
+    return gtfs.Shape(shape_id=shape_id, longitudes=longitudes, latitudes=latitudes)
@@ -1,10 +1,12 @@
 import struct
+import threading
 import zstandard
 from . import gtfs_pb2 as gtfs
 from .base import StringCache, FareLinks, IdReference
 from typing import BinaryIO
-from collections import Counter
-from collections.abc import Generator
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections.abc import Generator, Iterable
 from functools import cached_property
 
 
@@ -12,28 +14,69 @@ __all__ = ['gtfs', 'GtfsBlocks', 'GtfsProto', 'GtfsDelta',
            'FareLinks', 'is_gtfs_delta', 'SHAPE_SCALE', 'STOP_SCALE']
 SHAPE_SCALE = 100000
 STOP_SCALE = 100000
+# Header length, with 0x8000 set for deltas.
+_HEADER_LEN = struct.Struct('<H')
+# Blocks that have their sizes in the header, in order.
+_ALL_BLOCKS = tuple(gtfs.Block.values())
+_STORED_BLOCKS = tuple(b for b in _ALL_BLOCKS if 0 < b < gtfs.B_ITINERARIES)
+# Blocks this large are compressed with multiple threads.
+_THREADED_SIZE = 1024 * 1024
+# How many bytes of decompressed blocks to keep for repeated reads.
+_RAW_CACHE_SIZE = 64 * 1024 * 1024
+# How many blocks to decompress ahead of the caller when writing raw feeds.
+_DECOMPRESS_AHEAD = 2
+# Blocks that are always read with the header.
+_INDEX_BLOCKS = frozenset((gtfs.B_HEADER, gtfs.B_IDS, gtfs.B_STRINGS))
 
 
 def is_gtfs_delta(fileobj: BinaryIO) -> bool:
     fileobj.seek(0)
-    header_len = struct.unpack('<H', fileobj.read(2))[0]
+    header_len = _HEADER_LEN.unpack(fileobj.read(2))[0]
     fileobj.seek(0)
     return header_len & 0x8000 > 0
 
 
+def pack_repeated(messages: Iterable) -> bytes:
+    """
+    Serializes messages as the first repeated field of a container, like Stops.
+    That produces the same bytes as the container would, but spares copying every
+    message into it first.
+    """
+    parts: list[bytes] = []
+    for m in messages:
+        data = m.SerializeToString()
+        size = len(data)
+        header = bytearray(b'\x0a')  # field 1, length-delimited
+        while size > 0x7F:
+            header.append(size & 0x7F | 0x80)
+            size >>= 7
+        header.append(size)
+        parts.append(header)
+        parts.append(data)
+    return b''.join(parts)
+
+
 class GtfsBlocks:
     def __init__(self):
         self.blocks: dict[gtfs.Block, bytes] = {}
         self.arch = zstandard.ZstdCompressor(level=10)
+        # Output does not depend on the number of threads, only on using them.
+        self.arch_mt = zstandard.ZstdCompressor(level=10, threads=-1)
+        self.dearch = zstandard.ZstdDecompressor()
+        # Recently decompressed blocks, the least recently used first.
+        self._raw: OrderedDict[int, bytes] = OrderedDict()
 
     def clear(self):
         self.blocks = {}
+        self._raw.clear()
 
     def populate_header(self, header: gtfs.GtfsHeader, compressed: bool = False):
+        if compressed:
+            sizes = [len(self.blocks.get(b, b'')) for b in _STORED_BLOCKS]
+        else:
+            sizes = [self.raw_size(b) for b in _STORED_BLOCKS]
         del header.blocks[:]
-        for b in gtfs.Block.values():
-            if 0 < b and b < gtfs.B_ITINERARIES:
-                header.blocks.append(len(self.get(b, compressed)))
+        header.blocks.extend(sizes)
 
     @property
     def not_empty(self) -> bool:
@@ -51,23 +94,65 @@ class GtfsBlocks:
         return self.blocks[b]
 
     def decompressed(self) -> Generator[bytes, None, None]:
-        dearch = zstandard.ZstdDecompressor()
-        for b in sorted(self.blocks):
-            if self.blocks[b]:
-                yield dearch.decompress(self.blocks[b])
+        # Frames are independent and zstd releases the GIL, so blocks are
+        # decompressed in parallel while the caller consumes them in order.
+        # Decompressors are not thread-safe, hence one for each worker.
+        local = threading.local()
+
+        def decompress(data: bytes) -> bytes:
+            if not hasattr(local, 'dearch'):
+                local.dearch = zstandard.ZstdDecompressor()
+            return local.dearch.decompress(data)
+
+        # executor.map() would submit every block at once and keep all results
+        # in memory, so only a few blocks are decompressed ahead of the caller.
+        pending: deque[Future[bytes]] = deque()
+        with ThreadPoolExecutor(max_workers=_DECOMPRESS_AHEAD) as executor:
+            for b in sorted(self.blocks):
+                if self.blocks[b]:
+                    pending.append(executor.submit(decompress, self.blocks[b]))
+                    if len(pending) > _DECOMPRESS_AHEAD:
+                        yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
 
     def add(self, block: int, data: bytes, is_compressed: bool = False):
         if not data:
             return
-        self.blocks[block] = data if is_compressed else self.arch.compress(data)
+        if not is_compressed and block in self.blocks:
+            # Blocks that were read but not changed serialize to the same bytes.
+            # Decompressing is much cheaper than compressing them again.
+            if self.get(block) == data:
+                return
+        self._raw.pop(block, None)
+        if is_compressed:
+            self.blocks[block] = data
+        else:
+            arch = self.arch if len(data) < _THREADED_SIZE else self.arch_mt
+            self.blocks[block] = arch.compress(data)
+
+    def raw_size(self, block: int) -> int:
+        if block not in self.blocks:
+            return 0
+        # Frames store the content size, so there is no need to decompress the block.
+        size = zstandard.frame_content_size(self.blocks[block])
+        return size if size >= 0 else len(self.get(block))
 
     def get(self, block: int, compressed: bool = False) -> bytes:
         if block not in self.blocks:
             return b''
         if compressed:
             return self.blocks[block]
-        dearch = zstandard.ZstdDecompressor()
-        return dearch.decompress(self.blocks[block])
+        data = self._raw.get(block)
+        if data is not None:
+            self._raw.move_to_end(block)
+            return data
+        data = self.dearch.decompress(self.blocks[block])
+        self._raw[block] = data
+        size = sum(len(v) for v in self._raw.values())
+        while size > _RAW_CACHE_SIZE and len(self._raw) > 1:
+            size -= len(self._raw.popitem(last=False)[1])
+        return data
 
 
 class GtfsProto:
@@ -76,7 +161,7 @@ class GtfsProto:
         self.header.compressed = True
         self.strings = StringCache()
         self.id_store: dict[int, IdReference] = {
-            b: IdReference() for b in gtfs.Block.values()}
+            b: IdReference() for b in _ALL_BLOCKS}
 
         self.blocks = GtfsBlocks()
         # position, size
@@ -96,46 +181,63 @@ class GtfsProto:
         self._block_pos = {}
 
     def _read_blocks(self, fileobj: BinaryIO, read_now: bool):
-        arch = None if not self.header.compressed else zstandard.ZstdDecompressor()
+        arch = None if not self.header.compressed else self.blocks.dearch
         filepos = 2 + self._block_pos[gtfs.B_HEADER][1]
+        sizes: list[tuple[int, int]] = []
         for b, size in enumerate(self.header.blocks):
             if not size:
                 continue
             self._block_pos[b + 1] = (filepos, size)
             filepos += size
-
-            if b + 1 == gtfs.B_STRINGS:
-                data = fileobj.read(size)
-                if arch:
-                    data = arch.decompress(data)
+            sizes.append((b + 1, size))
+
+        # Blocks follow one another, so we read everything we need in one go.
+        # Ids and strings come first, and without read_now nothing else is needed.
+        to_read = sum(size for b, size in sizes
+                      if read_now or b in _INDEX_BLOCKS)
+        buffer = memoryview(fileobj.read(to_read))
+        offset = 0
+        for b, size in sizes:
+            if offset >= len(buffer):
+                break
+            data = buffer[offset:offset + size]
+            offset += size
+
+            if b == gtfs.B_STRINGS:
                 s = gtfs.StringTable()
-                s.ParseFromString(data)
+                s.ParseFromString(data if not arch else arch.decompress(data))
                 self.strings = StringCache(s.strings)
-            elif b + 1 == gtfs.B_IDS:
-                data = fileobj.read(size)
-                if arch:
-                    data = arch.decompress(data)
+            elif b == gtfs.B_IDS:
                 store = gtfs.IdStore()
-                store.ParseFromString(data)
+                store.ParseFromString(data if not arch else arch.decompress(data))
                 for idrefs in store.refs:
                     self.id_store[idrefs.block] = IdReference(idrefs.ids, idrefs.delta_skip)
-            elif read_now:
-                data = fileobj.read(size)
-                self.blocks.add(b + 1, data, self.header.compressed)
             else:
-                fileobj.seek(size, 1)
+                # Not copying: slices keep the read buffer alive, and both zstd
+                # and protobuf accept memoryviews.
+                self.blocks.add(b, data, self.header.compressed)
 
     def read_all(self):
         if not self._fileobj:
             return
-        for b in self._block_pos:
-            if b not in (gtfs.B_STRINGS, gtfs.B_IDS, gtfs.B_HEADER):
-                self._read_block(b, True)
+        missing = [b for b in self._block_pos
+                   if b not in _INDEX_BLOCKS
+                   and b not in self.blocks]
+        if missing:
+            # Blocks are stored contiguously, so fetch them with a single read.
+            start = min(self._block_pos[b][0] for b in missing)
+            end = max(sum(self._block_pos[b]) for b in missing)
+            self._fileobj.seek(start)
+            buffer = memoryview(self._fileobj.read(end - start))
+            for b in missing:
+                bseek, bsize = self._block_pos[b]
+                self.blocks.add(b, buffer[bseek - start:bseek - start + bsize],
+                                self._was_compressed)
         self._fileobj = None
 
     def read(self, fileobj: BinaryIO, read_now: bool = False):
         self.clear()
-        header_len = struct.unpack('<H', fileobj.read(2))[0]
+        header_len = _HEADER_LEN.unpack(fileobj.read(2))[0]
         if header_len & 0x8000 > 0:
             raise Exception('The file is delta, not a regular feed.')
         self.header = gtfs.GtfsHeader()
@@ -146,11 +248,9 @@ class GtfsProto:
 
     def _write_blocks(self, fileobj: BinaryIO):
         if self.header.compressed:
-            for b in self.blocks:
-                fileobj.write(b)
+            fileobj.writelines(self.blocks)
         else:
-            for b in self.blocks.decompressed():
-                fileobj.write(b)
+            fileobj.writelines(self.blocks.decompressed())
 
     def write(self, fileobj: BinaryIO, compress: bool | None = None):
         """When compress is None, using the value from the header."""
@@ -175,7 +275,9 @@ class GtfsProto:
         self.blocks.populate_header(self.header, self.header.compressed)
 
         header_data = self.header.SerializeToString()
-        fileobj.write(struct.pack('<H', len(header_data)))
+        if len(header_data) & 0x8000:
+            raise Exception(f'Header is too long: {len(header_data)} bytes')
+        fileobj.write(_HEADER_LEN.pack(len(header_data)))
         fileobj.write(header_data)
         self._write_blocks(fileobj)
 
@@ -203,10 +305,11 @@ class GtfsProto:
         self._fileobj.seek(bseek)
         data = self._fileobj.read(bsize)
         self.blocks.add(block, data, self._was_compressed)
-        if self._was_compressed and not compressed:
-            arch = zstandard.ZstdDecompressor()
-            data = arch.decompress(data)
-        return data if not compressed else self.blocks.get(block, True)
+        if compressed:
+            return self.blocks.get(block, True)
+        if self._was_compressed:
+            return self.blocks.get(block)
+        return data
 
     @cached_property
     def agencies(self) -> list[gtfs.Agency]:
@@ -219,8 +322,7 @@ class GtfsProto:
 
     def store_agencies(self):
         if 'agencies' in self.__dict__:
-            ag = gtfs.Agencies(agencies=self.agencies)
-            self.blocks.add(gtfs.B_AGENCY, ag.SerializeToString())
+            self.blocks.add(gtfs.B_AGENCY, pack_repeated(self.agencies))
         elif self._fileobj:
             self._read_block(gtfs.B_AGENCY, True)
 
@@ -242,12 +344,8 @@ class GtfsProto:
     def _get_shape_last(
             self, shape: gtfs.Shape,
             prev_last: tuple[int, int] = (0, 0)) -> tuple[int, int]:
-        lon = shape.longitudes[0] + prev_last[0]
-        lat = shape.latitudes[0] + prev_last[1]
-        for i in range(1, len(shape.longitudes)):
-            lon += shape.longitudes[i]
-            lat += shape.latitudes[i]
-        return (lon, lat)
+        # Summing over the containers runs in C, unlike indexing every element.
+        return (sum(shape.longitudes, prev_last[0]), sum(shape.latitudes, prev_last[1]))
 
     @cached_property
     def shapes(self) -> list[gtfs.Shape]:
@@ -258,31 +356,30 @@ class GtfsProto:
         shapes.ParseFromString(data)
 
         # Decouple shapes.
-        result: list[gtfs.Shape] = []
-        prev_last: tuple[int, int] = (0, 0)
-        for s in shapes.shapes:
+        result = list(shapes.shapes)
+        prev_lon, prev_lat = 0, 0
+        for s in result:
+            # Points inside a shape stay delta-encoded, only the first one is shifted.
             if s.longitudes:
-                s.longitudes[0] += prev_last[0]
-                s.latitudes[0] += prev_last[1]
-                prev_last = self._get_shape_last(s)
-            result.append(s)
+                lons, lats = s.longitudes, s.latitudes
+                lons[0] += prev_lon
+                lats[0] += prev_lat
+                prev_lon, prev_lat = sum(lons), sum(lats)
         return result
 
     def store_shapes(self):
         if 'shapes' in self.__dict__:
             # Make the sequence.
-            shapes: list[gtfs.Shape] = []
+            shapes = sorted(self.shapes, key=lambda k: k.shape_id)
             prev_last: tuple[int, int] = (0, 0)
-            for s in sorted(self.shapes, key=lambda k: k.shape_id):
+            for s in shapes:
                 if s.longitudes:
                     s.longitudes[0] -= prev_last[0]
                     s.latitudes[0] -= prev_last[1]
                     prev_last = self._get_shape_last(s, prev_last)
-                shapes.append(s)
 
             # Compress the data.
-            sh = gtfs.Shapes(shapes=shapes)
-            self.blocks.add(gtfs.B_SHAPES, sh.SerializeToString())
+            self.blocks.add(gtfs.B_SHAPES, pack_repeated(shapes))
         elif self._fileobj:
             # Off chance it's not read, re-read.
             self._read_block(gtfs.B_SHAPES, True)
@@ -296,32 +393,29 @@ class GtfsProto:
         stops.ParseFromString(data)
 
         # Decouple stops.
-        result: list[gtfs.Stop] = []
-        prev_coord: tuple[int, int] = (0, 0)
-        for s in stops.stops:
-            if s.lon and s.lat:
-                s.lon += prev_coord[0]
-                s.lat += prev_coord[1]
-                prev_coord = (s.lon, s.lat)
-            result.append(s)
+        result = list(stops.stops)
+        prev_lon, prev_lat = 0, 0
+        for s in result:
+            lon, lat = s.lon, s.lat
+            if lon and lat:
+                prev_lon += lon
+                prev_lat += lat
+                s.lon, s.lat = prev_lon, prev_lat
         return result
 
     def store_stops(self):
         if 'stops' in self.__dict__:
             # Make the sequence.
-            stops: list[gtfs.Stop] = []
-            prev_coord: tuple[int, int] = (0, 0)
-            for s in sorted(self.stops, key=lambda k: k.stop_id):
-                if s.lon and s.lat:
-                    pc = (s.lon, s.lat)
-                    s.lon -= prev_coord[0]
-                    s.lat -= prev_coord[1]
-                    prev_coord = pc
-                stops.append(s)
+            stops = sorted(self.stops, key=lambda k: k.stop_id)
+            prev_lon, prev_lat = 0, 0
+            for s in stops:
+                lon, lat = s.lon, s.lat
+                if lon and lat:
+                    s.lon, s.lat = lon - prev_lon, lat - prev_lat
+                    prev_lon, prev_lat = lon, lat
 
             # Compress the data.
-            st = gtfs.Stops(stops=stops)
-            self.blocks.add(gtfs.B_STOPS, st.SerializeToString())
+            self.blocks.add(gtfs.B_STOPS, pack_repeated(stops))
         elif self._fileobj:
             self._read_block(gtfs.B_STOPS, True)
 
@@ -336,8 +430,7 @@ class GtfsProto:
 
     def store_routes(self):
         if 'routes' in self.__dict__:
-            r = gtfs.Routes(routes=self.routes)
-            self.blocks.add(gtfs.B_ROUTES, r.SerializeToString())
+            self.blocks.add(gtfs.B_ROUTES, pack_repeated(self.routes))
         elif self._fileobj:
             self._read_block(gtfs.B_ROUTES, True)
 
@@ -352,8 +445,7 @@ class GtfsProto:
 
     def store_trips(self):
         if 'trips' in self.__dict__:
-            t = gtfs.Trips(trips=self.trips)
-            self.blocks.add(gtfs.B_TRIPS, t.SerializeToString())
+            self.blocks.add(gtfs.B_TRIPS, pack_repeated(self.trips))
         elif self._fileobj:
             self._read_block(gtfs.B_TRIPS, True)
 
@@ -368,8 +460,7 @@ class GtfsProto:
 
     def store_transfers(self):
         if 'transfers' in self.__dict__:
-            tr = gtfs.Transfers(transfers=self.transfers)
-            self.blocks.add(gtfs.B_TRANSFERS, tr.SerializeToString())
+            self.blocks.add(gtfs.B_TRANSFERS, pack_repeated(self.transfers))
         elif self._fileobj:
             self._read_block(gtfs.B_TRANSFERS, True)
 
@@ -380,14 +471,14 @@ class GtfsProto:
             return {}
         networks = gtfs.Networks()
         networks.ParseFromString(data)
-        return {k: v for k, v in networks.networks.items()}
+        return dict(networks.networks)
 
     def store_networks(self):
         if 'networks' in self.__dict__:
             networks = gtfs.Networks(networks=self.networks)
             self.blocks.add(gtfs.B_NETWORKS, networks.SerializeToString())
         elif self._fileobj:
-            self._read_block(gtfs.B_NETWORKS)
+            self._read_block(gtfs.B_NETWORKS, True)
 
     @cached_property
     def areas(self) -> dict[int, str]:
@@ -396,14 +487,14 @@ class GtfsProto:
             return {}
         areas = gtfs.Areas()
         areas.ParseFromString(data)
-        return {k: v for k, v in areas.areas.items()}
+        return dict(areas.areas)
 
     def store_areas(self):
         if 'areas' in self.__dict__:
             areas = gtfs.Areas(areas=self.areas)
             self.blocks.add(gtfs.B_AREAS, areas.SerializeToString())
         elif self._fileobj:
-            self._read_block(gtfs.B_AREAS)
+            self._read_block(gtfs.B_AREAS, True)
 
     @cached_property
     def fare_links(self) -> FareLinks:
@@ -419,7 +510,7 @@ class GtfsProto:
         if 'fare_links' in self.__dict__:
             self.blocks.add(gtfs.B_FARE_LINKS, self.fare_links.store())
         elif self._fileobj:
-            self._read_block(gtfs.B_FARE_LINKS)
+            self._read_block(gtfs.B_FARE_LINKS, True)
 
     def pack_strings(self, sort=False):
         """
@@ -434,18 +525,13 @@ class GtfsProto:
             return
 
         # Count occurences.
-        c: Counter[int] = Counter()
-        for a in self.agencies:
-            c[a.timezone] += 1
-        for s in self.stops:
-            c[s.name] += 1
+        c: Counter[int] = Counter(a.timezone for a in self.agencies)
+        c.update(s.name for s in self.stops)
         for r in self.routes:
-            for n in r.long_name:
-                c[n] += 1
+            c.update(r.long_name)
+            c.update(i.headsign for i in r.itineraries)
             for i in r.itineraries:
-                c[i.headsign] += 1
-                for h in i.stop_headsigns:
-                    c[h] += 1
+                c.update(i.stop_headsigns)
         del c[0]
 
         # Build the new strings list.
@@ -467,13 +553,12 @@ class GtfsProto:
             a.timezone = repl[a.timezone]
         for s in self.stops:
             s.name = repl[s.name]
+        # Repeated fields are replaced whole, not element by element.
         for r in self.routes:
-            for ln in range(len(r.long_name)):
-                r.long_name[ln] = repl[r.long_name[ln]]
+            r.long_name[:] = [repl[n] for n in r.long_name]
             for i in r.itineraries:
                 i.headsign = repl[i.headsign]
-                for hn in range(len(i.stop_headsigns)):
-                    i.stop_headsigns[hn] = repl[i.stop_headsigns[hn]]
+                i.stop_headsigns[:] = [repl[h] for h in i.stop_headsigns]
 
 
 class GtfsDelta(GtfsProto):
@@ -482,7 +567,7 @@ class GtfsDelta(GtfsProto):
         self.header.compressed = True
         self.strings = StringCache()
         self.id_store: dict[int, IdReference] = {
-            b: IdReference() for b in gtfs.Block.values()}
+            b: IdReference() for b in _ALL_BLOCKS}
 
         self.blocks = GtfsBlocks()
         # position, size
@@ -494,7 +579,7 @@ class GtfsDelta(GtfsProto):
 
     def read(self, fileobj: BinaryIO, read_now: bool = False):
         self.clear()
-        header_len = struct.unpack('<H', fileobj.read(2))[0]
+        header_len = _HEADER_LEN.unpack(fileobj.read(2))[0]
         if header_len & 0x8000 == 0:
             raise Exception('The file is a regular feed, not a delta.')
         header_len &= 0x7FFF
@@ -527,7 +612,9 @@ class GtfsDelta(GtfsProto):
         self.blocks.populate_header(self.header, self.header.compressed)
 
         header_data = self.header.SerializeToString()
-        fileobj.write(struct.pack('<H', len(header_data) | 0x8000))
+        if len(header_data) & 0x8000:
+            raise Exception(f'Header is too long: {len(header_data)} bytes')
+        fileobj.write(_HEADER_LEN.pack(len(header_data) | 0x8000))
         fileobj.write(header_data)
         self._write_blocks(fileobj)
 
@@ -545,4 +632,4 @@ class GtfsDelta(GtfsProto):
         if 'fare_links' in self.__dict__:
             self.blocks.add(gtfs.B_FARE_LINKS, self.fare_links.store_delta())
         elif self._fileobj:
-            self._read_block(gtfs.B_FARE_LINKS)
+            self._read_block(gtfs.B_FARE_LINKS, True)